@@ -5,23 +5,77 @@
 
 
 import logging
+import numba
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+
+@numba.njit(cache=True)
+def _ema_and_cross(close, alpha):
+    """
+    Single pass computing the EMA of close and its crossover signal.
+
+    The EMA follows ewm(adjust=False) seeding (EMA[0] == close[0]) and its
+    handling of NaN: the EMA is held across missing closes and the next
+    observation is reweighted as pandas does. The signal is int8: 1 where
+    close crosses above the EMA, -1 where it crosses below, 0 otherwise,
+    and always 0 on a missing bar and the bar after it.
+    """
+    n = close.shape[0]
+    ema_arr = np.empty(n, dtype=np.float64)
+    sig_arr = np.zeros(n, dtype=np.int8)
+
+    ema = np.nan
+    old_wt = 1.0
+    prev_side = 0
+    have_prev = False
+    for i in range(n):
+        c = close[i]
+        observed = c == c
+        # same recursion as pandas' ewma for adjust=False, ignore_na=False
+        if ema == ema:
+            old_wt *= 1.0 - alpha
+            if observed:
+                if ema != c:
+                    ema = (old_wt * ema + alpha * c) / (old_wt + alpha)
+                old_wt = 1.0
+        elif observed:
+            ema = c
+        ema_arr[i] = ema
+
+        if observed:
+            # side of the EMA the close is on: sign(close - ema)
+            side = (c > ema) - (c < ema)
+            if have_prev and side != 0 and side != prev_side:
+                sig_arr[i] = side
+            prev_side = side
+        have_prev = observed
+    return ema_arr, sig_arr
+
+
 class EMASignal:
     """
     A class to calculate EMA signals and save results.
     """
-    def __init__(self, data: pd.DataFrame, ema_period: int = 89):
+    def __init__(self, data: pd.DataFrame, ema_period: int = 89, copy: bool = False,
+                 dtype: npt.DTypeLike = np.float32):
         """
         Initialize with a DataFrame containing Open, High, Low, Close columns.
 
         Args:
             data (pd.DataFrame): Input market data.
             ema_period (int): Period for the EMA calculation.
+            copy (bool): If True, work on a copy of data. By default the EMA
+                and signal columns are written into data, modifying it in place.
+            dtype (npt.DTypeLike): Float dtype the EMA column is stored in. The
+                EMA and its crossovers are computed in float64 either way.
 
         Raises:
             ValueError: If the required columns are missing.
@@ -31,64 +85,82 @@ class EMASignal:
             missing = required_cols - set(data.columns)
             raise ValueError(f"Missing required columns: {missing}")
 
-        self.df = data.copy()
+        self.df = data.copy() if copy else data
         self.ema_period = ema_period
+        self.dtype = dtype
+        self._cross = None
+        self._signals = None
 
     def calculate_ema(self) -> None:
         """
         Calculate the Exponential Moving Average and add it as 'EMA_{period}'.
+        The crossover signal is computed in the same pass and kept for generate_signals().
         """
         ema_col = f'EMA_{self.ema_period}'
-        self.df[ema_col] = self.df['Close'].ewm(span=self.ema_period, adjust=False).mean()
+        close = self.df['Close'].to_numpy(dtype=np.float64)
+        alpha = 2.0 / (self.ema_period + 1)
+        ema, self._cross = _ema_and_cross(close, alpha)
+        self.df[ema_col] = ema.astype(self.dtype)
         logging.info(f"Calculated {ema_col}.")
 
     def generate_signals(self) -> None:
         """
         Generate long/short signals when Close crosses above/below the EMA.
-        Populates 'Signal_{period}EMA' column.
+        Populates 'Signal_{period}EMA' column (materialized by get_dataframe()).
         """
         ema_col = f'EMA_{self.ema_period}'
         sig_col = f'Signal_{self.ema_period}EMA'
 
-        if ema_col not in self.df.columns:
+        if ema_col not in self.df.columns or self._cross is None:
             raise RuntimeError(f"{ema_col} not found. Call calculate_ema() first.")
 
-        close = self.df['Close']
-        ema = self.df[ema_col]
-        prev_close = close.shift(1)
-        prev_ema = ema.shift(1)
-
-        cross_above = (close > ema) & (prev_close <= prev_ema)
-        cross_below = (close < ema) & (prev_close >= prev_ema)
-
-        self.df[sig_col] = pd.NA
-        self.df.loc[cross_above, sig_col] = 'long'
-        self.df.loc[cross_below, sig_col] = 'short'
+        self._signals = self._cross
         logging.info(f"Generated signals in column {sig_col}.")
 
     def get_dataframe(self) -> pd.DataFrame:
         """
         Return the processed DataFrame.
         """
+        if self._signals is not None:
+            sig_col = f'Signal_{self.ema_period}EMA'
+            self.df[sig_col] = np.where(self._signals == 1, 'long', np.where(self._signals == -1, 'short', pd.NA))
+            self._signals = None
         return self.df
 
-    def save_to_csv(self, path: str) -> None:
+    def save_to_csv(self, path: str, file_format: str = 'csv') -> None:
         """
-        Save the processed DataFrame to a CSV file.
+        Save the processed DataFrame as CSV, Parquet or Feather.
+
+        Args:
+            path (str): Output file path.
+            file_format (str): 'csv' (written with the PyArrow CSV writer), 'parquet' or 'feather'.
+
+        Raises:
+            ValueError: If the format is not supported.
         """
+        if file_format not in ('csv', 'parquet', 'feather'):
+            raise ValueError(f"Unsupported output format: {file_format}")
+
         try:
-            self.df.to_csv(path, index=False)
+            df = self.get_dataframe()
+            if file_format == 'parquet':
+                df.to_parquet(path, index=False)
+            elif file_format == 'feather':
+                df.reset_index(drop=True).to_feather(path)
+            else:
+                pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
             logging.info(f"Saved DataFrame to {path}.")
         except Exception as e:
-            logging.error(f"Failed to save to CSV: {e}")
+            logging.error(f"Failed to save to {file_format}: {e}")
             raise
 
 
-def process_ema_signals(df: pd.DataFrame, ema_period: int = 89) -> pd.DataFrame:
+def process_ema_signals(df: pd.DataFrame, ema_period: int = 89,
+                        dtype: npt.DTypeLike = np.float32) -> pd.DataFrame:
     """
     Helper function to compute EMA and signals on a DataFrame.
     """
-    processor = EMASignal(df, ema_period)
+    processor = EMASignal(df, ema_period, dtype=dtype)
     processor.calculate_ema()
     processor.generate_signals()
     return processor.get_dataframe()
@@ -100,7 +172,7 @@ if __name__ == '__main__':
     output_path = '/Users/puneetanand/Documents/projects/max-algos/tmp_data/_EURUSD_output_signals.csv'
 
     try:
-        df_input = pd.read_csv(input_path)
+        df_input = pd.read_csv(input_path, engine='pyarrow', dtype_backend='pyarrow')
         logging.info(f"Loaded data from {input_path}.")
     except FileNotFoundError:
         logging.error(f"Input file '{input_path}' not found.")
@@ -110,7 +182,7 @@ if __name__ == '__main__':
         df_result = process_ema_signals(df_input)
         print(df_result.tail(10))
         try:
-            df_result.to_csv(output_path, index=False)
+            pacsv.write_csv(pa.Table.from_pandas(df_result, preserve_index=False), output_path)
             logging.info(f"Saved results to {output_path}.")
         except Exception as e:
             logging.error(f"Could not save results: {e}")
@@ -1,10 +1,222 @@
+import numba
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from scipy.signal import lfilter
 from typing import Optional
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# below this many bars the two MACD EMAs are computed serially; spinning up
+# worker threads costs more than the overlap saves on short series
+_THREADED_EMA_MIN_BARS = 1_000_000
+
+
+def _ema(x: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Exponential moving average matching pandas' ewm(alpha=alpha, adjust=False).mean().
+
+    Runs the recursion s[t] = alpha * x[t] + (1 - alpha) * s[t-1] as an IIR
+    filter, seeded so that s[0] == x[0]. If x has NaNs, the filter would carry them
+    forward, so ewm itself is used: it holds the average across missing bars.
+    """
+    if x.size == 0:
+        return np.empty(0)
+    if np.isnan(x).any():
+        return pd.Series(x).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    ema = np.empty(x.shape[0])
+    ema[0] = x[0]
+    # initial filter state (1 - alpha) * s[0] continues the recursion from exactly x[0]
+    ema[1:], _ = lfilter([alpha], [1.0, alpha - 1.0], x[1:], zi=[(1.0 - alpha) * x[0]])
+    return ema
+
+
+def _next_index(mask: np.ndarray) -> np.ndarray:
+    """
+    For every position i, the first j >= i where mask[j] is True (len(mask) if none).
+
+    The result carries one extra trailing entry equal to len(mask), so lookups
+    at i + 1 are valid for every bar.
+    """
+    n = mask.shape[0]
+    idx = np.append(np.where(mask, np.arange(n), n), n)
+    return np.ascontiguousarray(np.minimum.accumulate(idx[::-1])[::-1])
+
+
+def _readonly(dtype):
+    # inputs may be read-only views (pandas copy-on-write); writable arrays match too
+    return numba.types.Array(dtype, 1, 'A', readonly=True)
+
+
+# Eagerly compiled for the one signature simulate_trades uses; with cache=True
+# the machine code is reused across processes instead of JIT-compiling per run.
+@numba.njit(
+    numba.types.Tuple((numba.int8[:], numba.int8[:], numba.float64[:],
+                       numba.int8[:], numba.int32[:], numba.boolean[:]))(
+        _readonly(numba.float64), _readonly(numba.int8), _readonly(numba.int64),
+        _readonly(numba.int64), _readonly(numba.int64), numba.float64
+    ),
+    cache=True
+)
+def _simulate(close, raw, next_entry, long_exit, short_exit, inv_pip):
+    """
+    Trade state machine behind MACDStrategy.simulate_trades.
+
+    Rather than testing exit conditions on every bar, each trade jumps
+    straight from its entry to its exit using precomputed next-event indices
+    (see _next_index), so the loop runs once per trade.
+
+    Args:
+        close (np.ndarray): Close prices.
+        raw (np.ndarray): Raw EMA signal as int8 (0=none, 1=long, -1=short).
+        next_entry (np.ndarray): Next bar with a raw signal.
+        long_exit (np.ndarray): Next bar closing a long (short signal or MACD_hist < 0).
+        short_exit (np.ndarray): Next bar closing a short (long signal or MACD_hist > 0).
+        inv_pip (float): Pips per price unit (1 / pip_size).
+
+    Returns:
+        Tuple of arrays: entry/exit direction codes (int8, 0=none),
+        unrounded profit in pips (NaN when no exit), exit type (int8, 0=none,
+        1=ema_cross, 2=macd), trade id (int32, 0=none) and in_position.
+    """
+    n = close.shape[0]
+    entry_sig = np.zeros(n, dtype=np.int8)
+    exit_sig = np.zeros(n, dtype=np.int8)
+    profit = np.full(n, np.nan)
+    exit_type = np.zeros(n, dtype=np.int8)
+    trade_id = np.zeros(n, dtype=np.int32)
+    in_position = np.zeros(n, dtype=np.bool_)
+
+    trade_counter = 0
+    i = next_entry[0]
+    while i < n:
+        position = raw[i]
+        entry_price = close[i]
+        trade_counter += 1
+        entry_sig[i] = position
+
+        # exits are only checked from the bar after entry
+        e = long_exit[i + 1] if position == 1 else short_exit[i + 1]
+        stop = min(e + 1, n)
+        in_position[i:stop] = True
+        trade_id[i:stop] = trade_counter
+        if e == n:
+            break
+
+        exit_sig[e] = position
+        # an opposite raw EMA signal takes precedence over the MACD exit
+        exit_type[e] = 1 if raw[e] == -position else 2
+        profit[e] = position * (close[e] - entry_price) * inv_pip
+        i = next_entry[e + 1]
+
+    return entry_sig, exit_sig, profit, exit_type, trade_id, in_position
+
+
+@numba.njit(cache=True)
+def _ewm_step(mean, old_wt, x, alpha):
+    """
+    Advance ewm(alpha=alpha, adjust=False) by one value, as pandas does.
+
+    NaN inputs hold the mean, and the next observation gets the weight the
+    skipped bars would have had. Returns the new (mean, old_wt).
+    """
+    if mean == mean:
+        old_wt *= 1.0 - alpha
+        if x == x:
+            if mean != x:
+                mean = (old_wt * mean + alpha * x) / (old_wt + alpha)
+            old_wt = 1.0
+    elif x == x:
+        mean = x
+    return mean, old_wt
+
+
+@numba.njit(cache=True)
+def simulate_from_close(close, alpha_ema, alpha_fast, alpha_slow, alpha_sig, pip_size):
+    """
+    Run the whole EMA signal + MACD strategy over Close in a single pass.
+
+    Equivalent to process_ema_signals() followed by MACDStrategy's
+    calculate_macd() and simulate_trades(), but the EMA, crossover, MACD
+    and trade state are all kept as scalars, so no intermediate columns are
+    materialized. Alphas are 2 / (span + 1) for the crossover EMA, the fast
+    and slow MACD EMAs and the MACD signal line. Missing closes follow ewm's
+    NaN handling, as in the column-based path.
+
+    Everything is computed in float64, which is also what MACDStrategy
+    compares in whatever its dtype, so the trades are the same. The one
+    exception is a MACD_hist within float64 rounding of zero: lfilter and
+    this scalar recursion round differently and may resolve its sign
+    differently.
+
+    Returns:
+        Tuple of per-trade arrays: entry_idx, exit_idx (-1 while still open),
+        direction (int8, 1=long, -1=short) and unrounded profit in pips
+        (NaN while still open).
+    """
+    n = close.shape[0]
+    max_trades = (n + 1) // 2
+    entry_idx = np.empty(max_trades, dtype=np.int64)
+    exit_idx = np.empty(max_trades, dtype=np.int64)
+    direction = np.empty(max_trades, dtype=np.int8)
+    profit = np.empty(max_trades, dtype=np.float64)
+
+    inv_pip = 1.0 / pip_size
+    ema = fast = slow = sig = np.nan
+    ema_wt = fast_wt = slow_wt = sig_wt = 1.0
+    prev_side = 0
+    have_prev = False
+
+    trades = 0
+    in_trade = False
+    position = 0
+    entry_price = 0.0
+
+    for i in range(n):
+        c = close[i]
+        ema, ema_wt = _ewm_step(ema, ema_wt, c, alpha_ema)
+        fast, fast_wt = _ewm_step(fast, fast_wt, c, alpha_fast)
+        slow, slow_wt = _ewm_step(slow, slow_wt, c, alpha_slow)
+        macd = fast - slow
+        sig, sig_wt = _ewm_step(sig, sig_wt, macd, alpha_sig)
+        hist = macd - sig
+
+        # raw EMA crossover signal, as in ema_signals._ema_and_cross
+        code = 0
+        observed = c == c
+        if observed:
+            side = (c > ema) - (c < ema)
+            if have_prev and side != 0 and side != prev_side:
+                code = side
+            prev_side = side
+        have_prev = observed
+
+        if not in_trade:
+            if code != 0:
+                in_trade = True
+                position = code
+                entry_price = c
+                entry_idx[trades] = i
+                exit_idx[trades] = -1
+                direction[trades] = code
+                profit[trades] = np.nan
+                trades += 1
+            continue
+
+        # forced exit on opposite raw EMA signal, else MACD exit
+        if code == -position or (position == 1 and hist < 0) or (position == -1 and hist > 0):
+            exit_idx[trades - 1] = i
+            profit[trades - 1] = position * (c - entry_price) * inv_pip
+            in_trade = False
+
+    return entry_idx[:trades], exit_idx[:trades], direction[:trades], profit[:trades]
+
+
 class MACDStrategy:
     """
     Class to calculate MACD and simulate trades based on EMA entry signals.
@@ -15,7 +227,9 @@ class MACDStrategy:
         fast_period: int = 55,
         slow_period: int = 89,
         signal_period: int = 8,
-        pip_size: float = 0.0001
+        pip_size: float = 0.0001,
+        copy: bool = False,
+        dtype: npt.DTypeLike = np.float32
     ):
         """
         Initialize with DataFrame including 'Close' and raw EMA signals.
@@ -25,43 +239,70 @@ class MACDStrategy:
           - exit_signal (only on exit rows)
           - in_position (boolean)
 
+        entry_signal, exit_signal and exit_type are held as int8 codes
+        (0 = none) and trade_id as int32 (0 = none) until get_dataframe().
+
         Args:
             data (pd.DataFrame): Market data with raw Signal_{slow_period}EMA.
+            copy (bool): If True, leave data untouched and work on a copy with a
+                fresh RangeIndex. Otherwise the MACD and trade columns are added
+                to data in place, keeping its index.
+            dtype (npt.DTypeLike): Float dtype the MACD columns are stored in. MACD
+                is computed and trades are simulated in float64 regardless, so
+                the trades do not depend on it.
         """
         self.raw_sig = f'Signal_{slow_period}EMA'
         if 'Close' not in data.columns or self.raw_sig not in data.columns:
             raise ValueError("Input DataFrame must contain 'Close' and raw EMA signal column.")
 
-        self.df = data.copy().reset_index(drop=True)
+        self.df = data.reset_index(drop=True) if copy else data
         self.fast = fast_period
         self.slow = slow_period
         self.signal = signal_period
         self.pip_size = pip_size
+        # EMA smoothing factors, alpha = 2 / (span + 1)
+        self._alpha_fast = 2.0 / (fast_period + 1)
+        self._alpha_slow = 2.0 / (slow_period + 1)
+        self._alpha_signal = 2.0 / (signal_period + 1)
+        self.dtype = dtype
+        self._hist = None
 
         # initialize columns
-        self.df['entry_signal'] = pd.NA
-        self.df['exit_signal'] = pd.NA
-        self.df['in_position'] = False
-        self.df['profit'] = pd.NA
-        self.df['exit_type'] = pd.NA
-        self.df['trade_id'] = pd.NA
-        self.df['MACD'] = pd.NA
-        self.df['MACD_signal'] = pd.NA
-        self.df['MACD_hist'] = pd.NA
+        n = len(self.df)
+        self.df['entry_signal'] = np.zeros(n, dtype=np.int8)
+        self.df['exit_signal'] = np.zeros(n, dtype=np.int8)
+        self.df['in_position'] = np.zeros(n, dtype=bool)
+        self.df['profit'] = np.full(n, np.nan)
+        self.df['exit_type'] = np.zeros(n, dtype=np.int8)
+        self.df['trade_id'] = np.zeros(n, dtype=np.int32)
+        self._encoded = True
+        self.df['MACD'] = np.full(n, np.nan, dtype=dtype)
+        self.df['MACD_signal'] = np.full(n, np.nan, dtype=dtype)
+        self.df['MACD_hist'] = np.full(n, np.nan, dtype=dtype)
 
     def calculate_macd(self) -> None:
         """
         Calculate MACD, signal line, and histogram.
         """
-        fast_ema = self.df['Close'].ewm(span=self.fast, adjust=False).mean()
-        slow_ema = self.df['Close'].ewm(span=self.slow, adjust=False).mean()
+        close = self.df['Close'].to_numpy(dtype=np.float64)
+        if close.shape[0] >= _THREADED_EMA_MIN_BARS:
+            # the two EMAs are independent and lfilter releases the GIL, so run them side by side
+            with ThreadPoolExecutor(max_workers=2) as ex:
+                fast_fut = ex.submit(_ema, close, self._alpha_fast)
+                slow_fut = ex.submit(_ema, close, self._alpha_slow)
+                fast_ema, slow_ema = fast_fut.result(), slow_fut.result()
+        else:
+            fast_ema = _ema(close, self._alpha_fast)
+            slow_ema = _ema(close, self._alpha_slow)
         macd = fast_ema - slow_ema
-        signal = macd.ewm(span=self.signal, adjust=False).mean()
+        signal = _ema(macd, self._alpha_signal)
         hist = macd - signal
 
-        self.df['MACD'] = macd
-        self.df['MACD_signal'] = signal
-        self.df['MACD_hist'] = hist
+        self.df['MACD'] = macd.astype(self.dtype)
+        self.df['MACD_signal'] = signal.astype(self.dtype)
+        self.df['MACD_hist'] = hist.astype(self.dtype)
+        # exits compare against the float64 histogram, not the stored column
+        self._hist = hist
         logging.info("MACD series calculated.")
 
     def simulate_trades(self) -> None:
@@ -70,75 +311,104 @@ class MACDStrategy:
         Populates entry_signal, exit_signal, in_position, profit, exit_type, trade_id.
         """
         df = self.df
-        trade_counter = 0
-        in_trade = False
-        entry_price = None
-        position = None
+        inv_pip = 1.0 / self.pip_size
+        close = df['Close'].to_numpy(dtype=np.float64)
+        hist = self._hist if self._hist is not None else df['MACD_hist'].to_numpy(dtype=np.float64)
+        raw_sig = df[self.raw_sig].to_numpy(dtype=object, na_value='')
+        raw = np.where(raw_sig == 'long', 1, np.where(raw_sig == 'short', -1, 0)).astype(np.int8)
 
-        for idx in df.index:
-            raw = df.at[idx, self.raw_sig]
-            close = df.at[idx, 'Close']
+        next_entry = _next_index(raw != 0)
+        long_exit = _next_index((raw == -1) | (hist < 0))
+        short_exit = _next_index((raw == 1) | (hist > 0))
 
-            # detect entry if not in trade and raw signal is valid
-            if not in_trade and pd.notna(raw) and raw in ('long', 'short'):
-                in_trade = True
-                position = raw
-                entry_price = close
-                trade_counter += 1
-                df.at[idx, 'entry_signal'] = position
-                df.at[idx, 'in_position'] = True
-                df.at[idx, 'trade_id'] = trade_counter
-                logging.info(f"Entry {position} at idx {idx}, price {entry_price}")
-                continue
-
-            # if in trade, check exit conditions
-            if in_trade:
-                df.at[idx, 'in_position'] = True
-                df.at[idx, 'trade_id'] = trade_counter
-
-                # forced exit on opposite raw EMA signal
-                if pd.notna(raw) and raw in ('long', 'short') and raw != position:
-                    profit = ((close - entry_price) if position=='long' else (entry_price - close)) / self.pip_size
-                    df.at[idx, 'exit_signal'] = f"exit_{position}"
-                    df.at[idx, 'exit_type'] = 'ema_cross'
-                    df.at[idx, 'profit'] = round(profit,5)
-                    in_trade = False
-                    logging.info(f"Exit {position} at idx {idx} via EMA cross, profit {profit}")
-                    continue
-
-                # MACD exit
-                hist = df.at[idx, 'MACD_hist']
-                if (position=='long' and hist<0) or (position=='short' and hist>0):
-                    profit = ((close - entry_price) if position=='long' else (entry_price - close)) / self.pip_size
-                    df.at[idx, 'exit_signal'] = f"exit_{position}"
-                    df.at[idx, 'exit_type'] = 'macd'
-                    df.at[idx, 'profit'] = round(profit,5)
-                    in_trade = False
-                    logging.info(f"Exit {position} at idx {idx} via MACD, profit {profit}")
-                    continue
-
-        # cleanup: ensure in_position correctly reflects open trades
-        df['in_position'] = df['trade_id'].notna() & df['exit_signal'].isna()
-        logging.info("Trade simulation finished.")
-        df['in_position'] = df['trade_id'].notna() & df['exit_signal'].isna() | df['exit_signal'].notna()
-        logging.info("Trade simulation finished.")
+        entry_sig, exit_sig, profit, exit_type, trade_id, in_position = _simulate(
+            close, raw, next_entry, long_exit, short_exit, inv_pip
+        )
+        np.round(profit, 5, out=profit)
+
+        df['entry_signal'] = entry_sig
+        df['exit_signal'] = exit_sig
+        df['exit_type'] = exit_type
+        df['profit'] = profit
+        df['trade_id'] = trade_id
+        df['in_position'] = in_position
+        self._encoded = True
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            labels = {1: 'long', -1: 'short'}
+            exit_labels = {1: 'EMA cross', 2: 'MACD'}
+            for idx in np.flatnonzero(entry_sig | exit_sig):
+                if entry_sig[idx]:
+                    logging.debug("Entry %s at idx %d, price %s", labels[entry_sig[idx]], idx, close[idx])
+                else:
+                    logging.debug("Exit %s at idx %d via %s, profit %s",
+                                  labels[exit_sig[idx]], idx, exit_labels[exit_type[idx]], profit[idx])
+        logging.info("Trade simulation finished: %d trades.", trade_id.max(initial=0))
 
     def get_dataframe(self) -> pd.DataFrame:
+        """
+        Return the processed DataFrame, decoding the int8 signal codes to labels.
+        """
+        if self._encoded:
+            df = self.df
+            df['entry_signal'] = df['entry_signal'].map({0: pd.NA, 1: 'long', -1: 'short'})
+            df['exit_signal'] = df['exit_signal'].map({0: pd.NA, 1: 'exit_long', -1: 'exit_short'})
+            df['exit_type'] = df['exit_type'].map({0: pd.NA, 1: 'ema_cross', 2: 'macd'})
+            df['trade_id'] = df['trade_id'].astype('Int32').mask(df['trade_id'] == 0)
+            self._encoded = False
         return self.df
 
 
+def simulate_trade_log(
+    data: pd.DataFrame,
+    ema_period: int = 89,
+    fast_period: int = 55,
+    slow_period: int = 89,
+    signal_period: int = 8,
+    pip_size: float = 0.0001
+) -> pd.DataFrame:
+    """
+    Helper function to run the EMA signal + MACD strategy straight from data['Close'].
+
+    Takes the same trades as process_ema_signals() followed by MACDStrategy,
+    via simulate_from_close(), but only returns one row per trade.
+
+    Returns:
+        pd.DataFrame: trade_id, entry_idx and exit_idx (positional, <NA> while
+        the trade is open), direction ('long'/'short') and profit in pips
+        rounded to 5 decimals (NaN while open).
+    """
+    close = data['Close'].to_numpy(dtype=np.float64)
+    entry_idx, exit_idx, direction, profit = simulate_from_close(
+        close,
+        2.0 / (ema_period + 1),
+        2.0 / (fast_period + 1),
+        2.0 / (slow_period + 1),
+        2.0 / (signal_period + 1),
+        pip_size
+    )
+    np.round(profit, 5, out=profit)
+    return pd.DataFrame({
+        'trade_id': np.arange(1, entry_idx.shape[0] + 1, dtype=np.int32),
+        'entry_idx': entry_idx,
+        'exit_idx': pd.Series(exit_idx, dtype='Int64').mask(exit_idx < 0),
+        'direction': np.where(direction == 1, 'long', 'short'),
+        'profit': profit,
+    })
+
+
 if __name__ == '__main__':
     from ema_signals import process_ema_signals
     input_path = '/Users/puneetanand/Documents/projects/max-algos/tmp_data/_EURUSD_2025-02-15 16:19:59.001851_raw_data.csv'
     output_path = '/Users/puneetanand/Documents/projects/max-algos/tmp_data/_EURUSD_output_signals_macd.csv'
-    df_raw = pd.read_csv(input_path)
+    df_raw = pd.read_csv(input_path, engine='pyarrow', dtype_backend='pyarrow')
     df_ema = process_ema_signals(df_raw)
     strat = MACDStrategy(df_ema)
     strat.calculate_macd()
     strat.simulate_trades()
     df = strat.get_dataframe()
     print(df.tail(10))
-    df.to_csv(output_path, index=False)
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), output_path)
     logging.info("Saved results.")
 
 
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ema_signals import EMASignal, process_ema_signals
+
+
+def _frame(close):
+    close = np.asarray(close, dtype=np.float64)
+    return pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close})
+
+
+def _reference(close, span):
+    # ewm plus shifted comparisons, the way signals were generated with pandas
+    close = pd.Series(close, dtype=np.float64)
+    ema = close.ewm(span=span, adjust=False).mean()
+    prev_close, prev_ema = close.shift(1), ema.shift(1)
+    sig = np.full(len(close), None, dtype=object)
+    sig[((close > ema) & (prev_close <= prev_ema)).to_numpy()] = 'long'
+    sig[((close < ema) & (prev_close >= prev_ema)).to_numpy()] = 'short'
+    return ema.to_numpy(), sig
+
+
+def _check(close, span=89):
+    df = process_ema_signals(_frame(close), ema_period=span, dtype=np.float64)
+    ema, sig = _reference(close, span)
+    np.testing.assert_array_equal(df[f'EMA_{span}'].to_numpy(), ema)
+    got = df[f'Signal_{span}EMA'].to_numpy(dtype=object)
+    assert [None if pd.isna(v) else v for v in got] == list(sig)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_pandas_reference(seed):
+    rng = np.random.default_rng(seed)
+    _check(1.1 + np.cumsum(rng.normal(0.0, 0.0005, 2000)), span=int(rng.integers(2, 100)))
+
+
+def test_ties_with_ema():
+    # flat stretches put close exactly on the EMA
+    close = np.repeat([1.1, 1.2, 1.2, 1.1, 1.1, 1.3], 50)
+    _check(close, span=8)
+
+
+@pytest.mark.parametrize('nan_at', [[0], [0, 1], [3], [3, 4, 5], [-1]])
+def test_nan_close_matches_pandas(nan_at):
+    rng = np.random.default_rng(1)
+    close = 1.1 + np.cumsum(rng.normal(0.0, 0.0005, 300))
+    close[nan_at] = np.nan
+    _check(close, span=8)
+
+
+def test_all_nan_and_empty():
+    _check(np.full(5, np.nan))
+    _check(np.empty(0))
+
+
+def test_dtype_only_affects_stored_ema():
+    rng = np.random.default_rng(2)
+    df = _frame(1.1 + np.cumsum(rng.normal(0.0, 0.0005, 2000)))
+    out32 = process_ema_signals(df.copy(), dtype=np.float32)
+    out64 = process_ema_signals(df.copy(), dtype=np.float64)
+    assert out32['EMA_89'].dtype == np.float32
+    pd.testing.assert_series_equal(out32['Signal_89EMA'], out64['Signal_89EMA'])
+
+
+def test_missing_columns():
+    with pytest.raises(ValueError):
+        EMASignal(pd.DataFrame({'Close': [1.0]}))
+
+
+@pytest.mark.parametrize('file_format, read', [('csv', pd.read_csv), ('parquet', pd.read_parquet),
+                                              ('feather', pd.read_feather)])
+def test_save_round_trip(tmp_path, file_format, read):
+    processor = EMASignal(_frame(np.linspace(1.0, 1.1, 50)), dtype=np.float64)
+    processor.calculate_ema()
+    processor.generate_signals()
+    path = tmp_path / f'out.{file_format}'
+    processor.save_to_csv(str(path), file_format=file_format)
+    np.testing.assert_allclose(read(path)['EMA_89'], processor.get_dataframe()['EMA_89'])
+
+
+def test_save_unsupported_format(tmp_path):
+    with pytest.raises(ValueError):
+        EMASignal(_frame([1.0])).save_to_csv(str(tmp_path / 'out.xlsx'), file_format='xlsx')
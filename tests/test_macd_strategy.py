@@ -0,0 +1,234 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from macd_strategy import MACDStrategy, _ema, simulate_trade_log
+
+
+def _frame(close, signals=None):
+    close = np.asarray(close, dtype=np.float64)
+    if signals is None:
+        signals = [pd.NA] * len(close)
+    return pd.DataFrame({'Close': close, 'Signal_89EMA': pd.array(signals, dtype=object)})
+
+
+def _random_close(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 1.1 + np.cumsum(rng.normal(0.0, 0.0005, n))
+
+
+@pytest.mark.parametrize('span', [2, 8, 55, 89])
+def test_ema_matches_pandas_ewm(span):
+    x = _random_close(500)
+    expected = pd.Series(x).ewm(span=span, adjust=False).mean().to_numpy()
+    np.testing.assert_allclose(_ema(x, 2.0 / (span + 1)), expected, rtol=0, atol=1e-12)
+
+
+def test_ema_empty():
+    assert _ema(np.empty(0), 0.5).shape == (0,)
+
+
+@pytest.mark.parametrize('nan_at', [[0], [0, 1, 2], [10], [10, 11, 499]])
+def test_ema_with_nan_matches_pandas_ewm(nan_at):
+    x = _random_close(500)
+    x[nan_at] = np.nan
+    expected = pd.Series(x).ewm(span=55, adjust=False).mean().to_numpy()
+    np.testing.assert_array_equal(_ema(x, 2.0 / 56), expected)
+
+
+@pytest.mark.parametrize('nan_at', [[], [0], [5, 6], [199]])
+def test_calculate_macd_matches_pandas_ewm(nan_at):
+    close = _random_close(200)
+    close[nan_at] = np.nan
+    strat = MACDStrategy(_frame(close), dtype=np.float64)
+    strat.calculate_macd()
+
+    s = pd.Series(close)
+    macd = s.ewm(span=55, adjust=False).mean() - s.ewm(span=89, adjust=False).mean()
+    signal = macd.ewm(span=8, adjust=False).mean()
+    df = strat.get_dataframe()
+    np.testing.assert_allclose(df['MACD'], macd, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(df['MACD_signal'], signal, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(df['MACD_hist'], macd - signal, rtol=0, atol=1e-12)
+
+
+def test_runs_in_place_for_any_index():
+    close = _random_close(300)
+    signals = np.where(np.arange(300) % 40 == 5, 'long', None)
+    expected = _frame(close, signals)
+    strat = MACDStrategy(expected, copy=True)
+    strat.calculate_macd()
+    strat.simulate_trades()
+    expected = strat.get_dataframe()
+
+    data = _frame(close, signals).set_axis(pd.date_range('2025-01-01', periods=300, freq='min'))
+    strat = MACDStrategy(data)
+    strat.calculate_macd()
+    strat.simulate_trades()
+    out = strat.get_dataframe()
+    assert out is data
+    assert isinstance(out.index, pd.DatetimeIndex)
+    pd.testing.assert_frame_equal(out.reset_index(drop=True), expected)
+
+
+def _reference_trades(close, signals, hist, pip_size=0.0001):
+    # bar-by-bar state machine the vectorized simulation has to reproduce
+    n = len(close)
+    out = {k: [None] * n for k in ('entry_signal', 'exit_signal', 'exit_type', 'trade_id')}
+    out['profit'] = [np.nan] * n
+    trade_counter = 0
+    in_trade = False
+    for i in range(n):
+        raw = signals[i]
+        if not in_trade and raw in ('long', 'short'):
+            in_trade, position, entry_price = True, raw, close[i]
+            trade_counter += 1
+            out['entry_signal'][i] = position
+            out['trade_id'][i] = trade_counter
+            continue
+        if in_trade:
+            out['trade_id'][i] = trade_counter
+            if raw in ('long', 'short') and raw != position:
+                exit_type = 'ema_cross'
+            elif (position == 'long' and hist[i] < 0) or (position == 'short' and hist[i] > 0):
+                exit_type = 'macd'
+            else:
+                continue
+            move = close[i] - entry_price if position == 'long' else entry_price - close[i]
+            out['profit'][i] = round(move / pip_size, 5)
+            out['exit_signal'][i] = f'exit_{position}'
+            out['exit_type'][i] = exit_type
+            in_trade = False
+    out['in_position'] = [t is not None for t in out['trade_id']]
+    return out
+
+
+def _simulate_with_hist(close, signals, hist):
+    strat = MACDStrategy(_frame(close, signals))
+    strat.df['MACD_hist'] = np.asarray(hist, dtype=np.float64)
+    strat.simulate_trades()
+    return strat.get_dataframe()
+
+
+def _assert_matches_reference(df, close, signals, hist):
+    expected = _reference_trades(close, signals, hist)
+    for col in ('entry_signal', 'exit_signal', 'exit_type', 'trade_id'):
+        got = [None if pd.isna(v) else v for v in df[col]]
+        assert got == expected[col], col
+    assert df['in_position'].tolist() == expected['in_position']
+    np.testing.assert_allclose(df['profit'].to_numpy(dtype=np.float64), expected['profit'],
+                               rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_simulate_trades_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 400))
+    close = _random_close(n, seed)
+    signals = rng.choice(np.array(['long', 'short', None], dtype=object), n, p=[0.05, 0.05, 0.9])
+    # a coarse grid makes MACD_hist == 0 common
+    hist = rng.integers(-2, 3, n) * 1e-5
+    _assert_matches_reference(_simulate_with_hist(close, signals, hist), close, signals, hist)
+
+
+def test_hist_zero_does_not_exit():
+    close = [1.0, 1.1, 1.2, 1.3]
+    signals = ['long', None, 'short', None]
+    hist = [0.0, 0.0, 0.0, 0.0]
+    df = _simulate_with_hist(close, signals, hist)
+    assert df['exit_type'].iloc[2] == 'ema_cross'
+    _assert_matches_reference(df, close, signals, hist)
+
+
+def test_trade_open_at_last_bar():
+    close = [1.0, 1.1, 1.2, 1.3]
+    signals = [None, 'short', None, None]
+    hist = [0.0, -1.0, -1.0, -1.0]
+    df = _simulate_with_hist(close, signals, hist)
+    assert df['in_position'].tolist() == [False, True, True, True]
+    assert df['exit_signal'].isna().all()
+    _assert_matches_reference(df, close, signals, hist)
+
+
+def test_exit_and_new_signal_on_same_bar():
+    # the opposite signal closes the trade but does not open a new one on that bar
+    close = [1.0, 1.1, 1.2, 1.3, 1.4]
+    signals = ['long', None, 'short', None, 'short']
+    hist = [1.0, 1.0, 1.0, 1.0, 1.0]
+    df = _simulate_with_hist(close, signals, hist)
+    assert pd.isna(df['entry_signal'].iloc[2])
+    assert df['trade_id'].iloc[4] == 2
+    _assert_matches_reference(df, close, signals, hist)
+
+
+@pytest.mark.parametrize('close, signals', [([], []), ([1.0], ['long']), ([1.0], [None])])
+def test_empty_and_single_bar(close, signals):
+    strat = MACDStrategy(_frame(close, signals))
+    strat.calculate_macd()
+    strat.simulate_trades()
+    df = strat.get_dataframe()
+    _assert_matches_reference(df, close, signals, df['MACD_hist'].to_numpy(dtype=np.float64))
+
+
+def test_pipeline_with_close_on_ema_matches_reference():
+    from ema_signals import process_ema_signals
+
+    # flat stretches give close == EMA and MACD_hist == 0 bars
+    close = np.repeat([1.1, 1.1002, 1.1002, 1.0998, 1.1, 1.1003], 30)
+    ohlc = pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close})
+    strat = MACDStrategy(process_ema_signals(ohlc, dtype=np.float64), dtype=np.float64)
+    strat.calculate_macd()
+    strat.simulate_trades()
+    df = strat.get_dataframe()
+    signals = [None if pd.isna(v) else v for v in df['Signal_89EMA']]
+    _assert_matches_reference(df, close, signals, df['MACD_hist'].to_numpy())
+
+
+def test_threaded_macd_matches_serial(monkeypatch):
+    import macd_strategy
+
+    close = _random_close(1000)
+    serial = MACDStrategy(_frame(close), dtype=np.float64)
+    serial.calculate_macd()
+    monkeypatch.setattr(macd_strategy, '_THREADED_EMA_MIN_BARS', 0)
+    threaded = MACDStrategy(_frame(close), dtype=np.float64)
+    threaded.calculate_macd()
+    pd.testing.assert_frame_equal(threaded.get_dataframe(), serial.get_dataframe())
+
+
+def _trade_log_from_columns(df):
+    entries = np.flatnonzero(df['entry_signal'].notna())
+    exits = np.flatnonzero(df['exit_signal'].notna())
+    exit_idx = np.full(entries.shape[0], -1)
+    exit_idx[:exits.shape[0]] = exits
+    return entries, exit_idx, df['entry_signal'].iloc[entries].tolist(), df['profit'].to_numpy()[exits]
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('with_nan', [False, True])
+def test_simulate_trade_log_matches_columns_in_float64(seed, with_nan):
+    from ema_signals import process_ema_signals
+
+    rng = np.random.default_rng(seed)
+    close = _random_close(3000, seed)
+    if with_nan:
+        close[rng.choice(3000, 30, replace=False)] = np.nan
+        close[0] = np.nan
+    ohlc = pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close})
+    strat = MACDStrategy(process_ema_signals(ohlc.copy(), dtype=np.float64), dtype=np.float64)
+    strat.calculate_macd()
+    strat.simulate_trades()
+    entries, exit_idx, direction, profit = _trade_log_from_columns(strat.get_dataframe())
+
+    log = simulate_trade_log(ohlc)
+    assert len(entries) > 0
+    np.testing.assert_array_equal(log['entry_idx'], entries)
+    np.testing.assert_array_equal(log['exit_idx'].fillna(-1), exit_idx)
+    assert log['direction'].tolist() == direction
+    np.testing.assert_allclose(log['profit'].to_numpy()[:len(profit)], profit, rtol=0, atol=1e-9)
+
+
+def test_simulate_trade_log_empty():
+    log = simulate_trade_log(pd.DataFrame({'Close': []}))
+    assert log.empty
+    assert list(log.columns) == ['trade_id', 'entry_idx', 'exit_idx', 'direction', 'profit']